@@ -1,20 +1,27 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body, Query, status
+from fastapi import FastAPI, APIRouter, BackgroundTasks, HTTPException, Depends, Body, Query, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient, InsertOne, ReturnDocument, UpdateMany
+from pymongo.errors import DuplicateKeyError, OperationFailure
 import os
+import asyncio
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr, validator
+from pydantic import BaseModel, ConfigDict, Field, EmailStr, field_validator
 from typing import List, Optional, Dict, Any, Union
 import uuid
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
+import bcrypt
+from cachetools import TTLCache
 import jwt
+import time
 from enum import Enum
 import json
-from urllib.parse import urljoin
+import orjson
+from urllib.parse import unquote, urljoin
 
 # Project setup
 ROOT_DIR = Path(__file__).parent
@@ -22,11 +29,23 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# One client (and connection pool) for the whole process; a small pool serves
+# this API better than the driver default of 100
+client = AsyncMongoClient(
+    mongo_url,
+    maxPoolSize=int(os.environ.get("MONGO_MAX_POOL_SIZE", 20)),
+    minPoolSize=int(os.environ.get("MONGO_MIN_POOL_SIZE", 5)),
+    waitQueueTimeoutMS=2000,
+    serverSelectionTimeoutMS=3000,
+)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
-app = FastAPI(title="CashX API", description="Backend for CashX Cashback Rewards App")
+app = FastAPI(
+    title="CashX API",
+    description="Backend for CashX Cashback Rewards App",
+    default_response_class=ORJSONResponse,
+)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -35,11 +54,43 @@ api_router = APIRouter(prefix="/api")
 SECRET_KEY = os.environ.get("SECRET_KEY", "cashx_default_secret_key_change_in_production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+MAX_BATCH_REQUESTS = 20
+MAX_PRODUCTS_PAGE_SIZE = 100
+
+# Pre-encoded bodies for constant responses. A fresh Response is still built
+# per request because middleware (e.g. CORS) mutates the response headers.
+ROOT_RESPONSE_BODY = orjson.dumps({"message": "Welcome to CashX API"})
+WEBHOOK_QUEUED_RESPONSE_BODY = orjson.dumps({"status": "queued"})
+BCRYPT_ROUNDS = 10
+TOKEN_CACHE_MAXSIZE = 10_000
+TOKEN_CACHE_TTL_SECONDS = 300
+USER_VERSION_CACHE_MAXSIZE = 100_000
+PRODUCT_CACHE_MAXSIZE = 10_000
+PRODUCT_CACHE_TTL_SECONDS = 300
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
+# bcrypt is pure CPU work; run it in worker processes so it neither blocks the
+# event loop nor serializes on the GIL
+BCRYPT_POOL_WORKERS = os.cpu_count() or 1
+BCRYPT_POOL = ProcessPoolExecutor(max_workers=BCRYPT_POOL_WORKERS)
+
+# Verified tokens -> (user, token exp, user version). The TTL caps how stale a
+# cached profile can get in other worker processes; within this process any
+# write to a user bumps its version and invalidates the cached entries.
+TOKEN_CACHE: TTLCache = TTLCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
+# A version outlives every token entry cached before its last bump, so
+# dropping it once it expires can't revive a stale entry
+user_versions: TTLCache = TTLCache(maxsize=USER_VERSION_CACHE_MAXSIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+# Product id -> cashback percent; products change far less often than
+# transactions are recorded against them
+PRODUCT_CACHE: TTLCache = TTLCache(maxsize=PRODUCT_CACHE_MAXSIZE, ttl=PRODUCT_CACHE_TTL_SECONDS)
+
+# Strong references to fire-and-forget tasks so they aren't garbage collected
+background_tasks = set()
+
 # Enums
 class TransactionStatus(str, Enum):
     PENDING = "pending"
@@ -69,7 +120,8 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
     
-    @validator('password')
+    @field_validator('password')
+    @classmethod
     def password_strength(cls, v):
         if len(v) < 8:
             raise ValueError('Password must be at least 8 characters')
@@ -80,8 +132,7 @@ class User(UserBase):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     cashback_balance: float = 0.0
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Token(BaseModel):
     access_token: str
@@ -98,6 +149,13 @@ class BankAccount(BaseModel):
     is_default: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class BankAccountCreate(BaseModel):
+    account_holder: str
+    account_number: str
+    ifsc_code: str
+    bank_name: str
+    is_default: bool = True
+
 class UPIDetails(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -105,6 +163,10 @@ class UPIDetails(BaseModel):
     is_default: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class UPICreate(BaseModel):
+    upi_id: str
+    is_default: bool = True
+
 class Product(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     title: str
@@ -155,12 +217,42 @@ class RedemptionRequestCreate(BaseModel):
     bank_account_id: Optional[str] = None
     upi_id: Optional[str] = None
 
+class BatchRequestItem(BaseModel):
+    method: str = "GET"
+    path: str
+    body: Optional[Any] = None
+
+class BatchRequest(BaseModel):
+    requests: List[BatchRequestItem]
+
+class BatchResponseItem(BaseModel):
+    status: int
+    body: Any = None
+
+class BatchResponse(BaseModel):
+    responses: List[BatchResponseItem]
+
 # Security Functions
+# bcrypt only looks at the first 72 bytes of a password
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return bcrypt.checkpw(plain_password.encode("utf-8")[:72], hashed_password.encode("utf-8"))
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(password.encode("utf-8")[:72], bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
+
+def password_needs_rehash(hashed_password):
+    # Hashes look like $2b$<cost>$<salt+digest>; rehash any other cost on login
+    return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+
+async def run_in_bcrypt_pool(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(BCRYPT_POOL, func, *args)
+
+def spawn_background_task(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -172,19 +264,42 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_user_by_email(email: str):
-    user = await db.users.find_one({"email": email})
+async def get_user_by_email(email: str, projection: Optional[Dict[str, int]] = None):
+    user = await db.users.find_one({"email": email}, projection)
     return user
 
 async def authenticate_user(email: str, password: str):
-    user = await get_user_by_email(email)
+    # The login response needs the full profile, so only _id is left out here
+    user = await get_user_by_email(email, {"_id": 0})
     if not user:
         return False
-    if not verify_password(password, user["password"]):
+    if not await run_in_bcrypt_pool(verify_password, password, user["password"]):
         return False
+    if password_needs_rehash(user["password"]):
+        spawn_background_task(rehash_user_password(user["id"], password))
     return user
 
+async def rehash_user_password(user_id: str, password: str):
+    try:
+        new_hash = await run_in_bcrypt_pool(get_password_hash, password)
+        await db.users.update_one(
+            {"id": user_id},
+            {"$set": {"password": new_hash}}
+        )
+    except Exception:
+        logging.exception(f"Failed to rehash password for user {user_id}")
+
+def invalidate_cached_user(user_id: str):
+    user_versions[user_id] = user_versions.get(user_id, 0) + 1
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    cached = TOKEN_CACHE.get(token)
+    if cached is not None:
+        cached_user, exp, version = cached
+        if exp > time.time() and version == user_versions.get(cached_user.id, 0):
+            return cached_user
+        TOKEN_CACHE.pop(token, None)
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
@@ -193,25 +308,43 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     
-    user = await db.users.find_one({"id": user_id})
+    # Read the version before querying so a write that lands during the query
+    # leaves this entry already stale
+    version = user_versions.get(user_id, 0)
+    
+    # Never load the password hash for an authenticated request
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
     
-    # Remove password from user data
-    user.pop("password", None)
-    
-    return User(**user)
+    user_obj = User(**user)
+    TOKEN_CACHE[token] = (user_obj, payload["exp"], version)
+    return user_obj
+
+async def iter_json_array(first_doc, cursor):
+    yield b"[" + orjson.dumps(first_doc)
+    async for doc in cursor:
+        yield b"," + orjson.dumps(doc)
+    yield b"]"
+
+async def stream_json_array(cursor):
+    # Run the query before the response starts so query and connection errors
+    # still surface as a 500, then encode the rest as the cursor yields them
+    first_doc = await anext(cursor, None)
+    if first_doc is None:
+        return Response(content=b"[]", media_type="application/json")
+    return StreamingResponse(iter_json_array(first_doc, cursor), media_type="application/json")
 
 # API Routes
 @api_router.get("/")
 async def root():
-    return {"message": "Welcome to CashX API"}
+    return Response(content=ROOT_RESPONSE_BODY, media_type="application/json")
 
 # Authentication endpoints
 @api_router.post("/auth/register", response_model=User)
 async def register_user(user: UserCreate):
     # Check if user already exists
-    existing_user = await get_user_by_email(user.email)
+    existing_user = await get_user_by_email(user.email, {"_id": 1})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -220,11 +353,14 @@ async def register_user(user: UserCreate):
         email=user.email,
         name=user.name
     )
-    new_user_dict = new_user.dict()
-    new_user_dict["password"] = get_password_hash(user.password)
+    new_user_dict = new_user.model_dump()
+    new_user_dict["password"] = await run_in_bcrypt_pool(get_password_hash, user.password)
     
-    # Save to database
-    await db.users.insert_one(new_user_dict)
+    # Save to database; the unique email index settles concurrent registrations
+    try:
+        await db.users.insert_one(new_user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Don't return password
     new_user_dict.pop("password", None)
@@ -251,14 +387,38 @@ async def get_current_user_profile(current_user: User = Depends(get_current_user
     return current_user
 
 # Product endpoints
-@api_router.get("/products", response_model=List[Product])
-async def get_products(category: Optional[str] = None, limit: int = 20, skip: int = 0):
+# Read-only list endpoints return the stored documents in an ORJSONResponse
+# (or stream them), which skips both Pydantic and jsonable_encoder; the models
+# only document the response schema
+@api_router.get("/products", responses={200: {"model": List[Product]}})
+async def get_products(
+    category: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PRODUCTS_PAGE_SIZE),
+    after: Optional[str] = Query(
+        None,
+        description="created_at and id of the last product on the previous page, joined by '_'"
+    )
+):
     query = {}
     if category:
         query["category"] = category
-        
-    products = await db.products.find(query).skip(skip).limit(limit).to_list(limit)
-    return [Product(**product) for product in products]
+    
+    # Keyset pagination: resume after the last product seen instead of skipping
+    if after:
+        after_created_at, _, after_id = after.partition("_")
+        try:
+            after_created_at = datetime.fromisoformat(after_created_at)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+        if not after_id:
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+        query["$or"] = [
+            {"created_at": {"$lt": after_created_at}},
+            {"created_at": after_created_at, "id": {"$lt": after_id}},
+        ]
+    
+    cursor = db.products.find(query, {"_id": 0}).sort([("created_at", -1), ("id", -1)]).limit(limit)
+    return await stream_json_array(cursor)
 
 @api_router.get("/products/{product_id}", response_model=Product)
 async def get_product(product_id: str):
@@ -268,10 +428,11 @@ async def get_product(product_id: str):
     return Product(**product)
 
 # For demo purposes, let's add a function to seed some products
-@api_router.post("/seed/products", response_model=List[Product])
+@api_router.post("/seed/products", responses={200: {"model": List[Product]}})
 async def seed_products():
     # Clear existing products
     await db.products.delete_many({})
+    PRODUCT_CACHE.clear()
     
     # Sample products
     products = [
@@ -331,16 +492,15 @@ async def seed_products():
         }
     ]
     
-    product_objects = []
-    for product_data in products:
-        product = Product(
-            id=str(uuid.uuid4()),
-            **product_data
-        )
-        product_objects.append(product)
-        await db.products.insert_one(product.dict())
+    now = datetime.utcnow()
+    product_docs = [
+        {"id": str(uuid.uuid4()), "created_at": now, **product_data}
+        for product_data in products
+    ]
+    # insert_many adds an _id to each document, so hand it copies
+    await db.products.insert_many([dict(doc) for doc in product_docs], ordered=False)
     
-    return product_objects
+    return ORJSONResponse(product_docs)
 
 # Transaction endpoints
 @api_router.post("/transactions", response_model=Transaction)
@@ -348,13 +508,20 @@ async def create_transaction(
     transaction: TransactionCreate,
     current_user: User = Depends(get_current_user)
 ):
-    # Get product details
-    product = await db.products.find_one({"id": transaction.product_id})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
+    # Get product cashback rate
+    cashback_percent = PRODUCT_CACHE.get(transaction.product_id)
+    if cashback_percent is None:
+        product = await db.products.find_one(
+            {"id": transaction.product_id},
+            {"_id": 0, "cashback_percent": 1}
+        )
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        cashback_percent = product["cashback_percent"]
+        PRODUCT_CACHE[transaction.product_id] = cashback_percent
     
     # Calculate cashback
-    cashback_amount = (transaction.amount * product["cashback_percent"]) / 100
+    cashback_amount = (transaction.amount * cashback_percent) / 100
     
     # Create transaction
     new_transaction = Transaction(
@@ -368,77 +535,69 @@ async def create_transaction(
     )
     
     # Save to database
-    await db.transactions.insert_one(new_transaction.dict())
+    await db.transactions.insert_one(new_transaction.model_dump())
     
     return new_transaction
 
-@api_router.get("/transactions", response_model=List[Transaction])
+@api_router.get("/transactions", responses={200: {"model": List[Transaction]}})
 async def get_user_transactions(current_user: User = Depends(get_current_user)):
-    transactions = await db.transactions.find({"user_id": current_user.id}).to_list(100)
-    return [Transaction(**t) for t in transactions]
+    return await stream_json_array(db.transactions.find({"user_id": current_user.id}, {"_id": 0}).limit(100))
 
 # Bank account endpoints
 @api_router.post("/bank-accounts", response_model=BankAccount)
 async def add_bank_account(
-    bank_account: Dict[str, Any],
+    bank_account: BankAccountCreate,
     current_user: User = Depends(get_current_user)
 ):
-    # If this is set as default, unset any existing defaults
-    if bank_account.get("is_default", True):
-        await db.bank_accounts.update_many(
-            {"user_id": current_user.id},
-            {"$set": {"is_default": False}}
-        )
-    
     # Create new bank account
     new_bank_account = BankAccount(
         user_id=current_user.id,
-        account_holder=bank_account["account_holder"],
-        account_number=bank_account["account_number"],
-        ifsc_code=bank_account["ifsc_code"],
-        bank_name=bank_account["bank_name"],
-        is_default=bank_account.get("is_default", True)
+        **bank_account.model_dump()
     )
     
-    # Save to database
-    await db.bank_accounts.insert_one(new_bank_account.dict())
+    # Save to database, unsetting any existing default in the same round trip
+    operations = [InsertOne(new_bank_account.model_dump())]
+    if new_bank_account.is_default:
+        operations.insert(0, UpdateMany(
+            {"user_id": current_user.id, "is_default": True},
+            {"$set": {"is_default": False}}
+        ))
+    await db.bank_accounts.bulk_write(operations, ordered=True)
     
     return new_bank_account
 
-@api_router.get("/bank-accounts", response_model=List[BankAccount])
+@api_router.get("/bank-accounts", responses={200: {"model": List[BankAccount]}})
 async def get_bank_accounts(current_user: User = Depends(get_current_user)):
-    accounts = await db.bank_accounts.find({"user_id": current_user.id}).to_list(10)
-    return [BankAccount(**account) for account in accounts]
+    docs = await db.bank_accounts.find({"user_id": current_user.id}, {"_id": 0}).to_list(10)
+    return ORJSONResponse(docs)
 
 # UPI endpoints
 @api_router.post("/upi", response_model=UPIDetails)
 async def add_upi(
-    upi_details: Dict[str, Any],
+    upi_details: UPICreate,
     current_user: User = Depends(get_current_user)
 ):
-    # If this is set as default, unset any existing defaults
-    if upi_details.get("is_default", True):
-        await db.upi_details.update_many(
-            {"user_id": current_user.id},
-            {"$set": {"is_default": False}}
-        )
-    
     # Create new UPI details
     new_upi = UPIDetails(
         user_id=current_user.id,
-        upi_id=upi_details["upi_id"],
-        is_default=upi_details.get("is_default", True)
+        **upi_details.model_dump()
     )
     
-    # Save to database
-    await db.upi_details.insert_one(new_upi.dict())
+    # Save to database, unsetting any existing default in the same round trip
+    operations = [InsertOne(new_upi.model_dump())]
+    if new_upi.is_default:
+        operations.insert(0, UpdateMany(
+            {"user_id": current_user.id, "is_default": True},
+            {"$set": {"is_default": False}}
+        ))
+    await db.upi_details.bulk_write(operations, ordered=True)
     
     return new_upi
 
-@api_router.get("/upi", response_model=List[UPIDetails])
+@api_router.get("/upi", responses={200: {"model": List[UPIDetails]}})
 async def get_upi_details(current_user: User = Depends(get_current_user)):
-    upi_details = await db.upi_details.find({"user_id": current_user.id}).to_list(10)
-    return [UPIDetails(**upi) for upi in upi_details]
+    docs = await db.upi_details.find({"user_id": current_user.id}, {"_id": 0}).to_list(10)
+    return ORJSONResponse(docs)
 
 # Redemption endpoints
 @api_router.post("/redemptions", response_model=RedemptionRequest)
@@ -446,10 +605,6 @@ async def create_redemption_request(
     redemption: RedemptionRequestCreate,
     current_user: User = Depends(get_current_user)
 ):
-    # Check if user has enough balance
-    if current_user.cashback_balance < redemption.amount:
-        raise HTTPException(status_code=400, detail="Insufficient cashback balance")
-    
     # Validate redemption method details
     if redemption.method == RedemptionMethod.BANK_TRANSFER and not redemption.bank_account_id:
         raise HTTPException(status_code=400, detail="Bank account ID is required for bank transfers")
@@ -466,63 +621,80 @@ async def create_redemption_request(
         upi_id=redemption.upi_id
     )
     
-    # Update user balance
-    await db.users.update_one(
-        {"id": current_user.id},
+    # Debit the balance only if it covers the amount; the cached profile's
+    # balance may be stale, so the stored one is the source of truth
+    result = await db.users.update_one(
+        {"id": current_user.id, "cashback_balance": {"$gte": redemption.amount}},
         {"$inc": {"cashback_balance": -redemption.amount}}
     )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=400, detail="Insufficient cashback balance")
+    invalidate_cached_user(current_user.id)
     
     # Save redemption request
-    await db.redemption_requests.insert_one(new_redemption.dict())
+    await db.redemption_requests.insert_one(new_redemption.model_dump())
     
     return new_redemption
 
-@api_router.get("/redemptions", response_model=List[RedemptionRequest])
+@api_router.get("/redemptions", responses={200: {"model": List[RedemptionRequest]}})
 async def get_redemption_requests(current_user: User = Depends(get_current_user)):
-    redemptions = await db.redemption_requests.find({"user_id": current_user.id}).to_list(100)
-    return [RedemptionRequest(**r) for r in redemptions]
+    return await stream_json_array(db.redemption_requests.find({"user_id": current_user.id}, {"_id": 0}).limit(100))
 
 # Webhook endpoint for affiliate callbacks
-@api_router.post("/webhooks/amazon-associates")
-async def amazon_associates_webhook(payload: Dict[str, Any] = Body(...)):
-    # This is a placeholder for the Amazon Associates webhook
-    # In a real implementation, you would validate the webhook signature
-    # and process the data accordingly
-    
-    # For demo purposes, let's just log the payload
-    logging.info(f"Received webhook from Amazon Associates: {json.dumps(payload)}")
-    
-    # Extract order details from payload (this would depend on actual Amazon webhook format)
-    # This is just a placeholder
-    order_id = payload.get("amazon_order_id")
-    if not order_id:
-        raise HTTPException(status_code=400, detail="Missing order ID")
-    
-    # Find related transaction by order ID
-    transaction = await db.transactions.find_one({"amazon_order_id": order_id})
-    if not transaction:
-        logging.warning(f"No transaction found for order ID: {order_id}")
-        return {"status": "No matching transaction found"}
-    
-    # Update transaction status
-    await db.transactions.update_one(
-        {"amazon_order_id": order_id},
+async def process_amazon_webhook(payload: Dict[str, Any]):
+    # For demo purposes, let's just log the payload (only encoded if INFO is enabled)
+    if logger.isEnabledFor(logging.INFO):
+        try:
+            encoded_payload = orjson.dumps(payload).decode()
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which only the stdlib encoder accepts
+            encoded_payload = json.dumps(payload)
+        logger.info("Received webhook from Amazon Associates: %s", encoded_payload)
+    
+    order_id = payload["amazon_order_id"]
+    
+    # Atomically claim the pending transaction so webhook retries can't credit twice
+    transaction = await db.transactions.find_one_and_update(
+        {"amazon_order_id": order_id, "status": TransactionStatus.PENDING},
         {
             "$set": {
                 "status": TransactionStatus.VERIFIED,
                 "verification_method": VerificationMethod.WEBHOOK,
                 "verified_at": datetime.utcnow()
             }
-        }
+        },
+        return_document=ReturnDocument.BEFORE
     )
+    if not transaction:
+        logger.warning("No pending transaction found for order ID: %s", order_id)
+        return
     
     # Update user's cashback balance
     await db.users.update_one(
         {"id": transaction["user_id"]},
         {"$inc": {"cashback_balance": transaction["cashback_amount"]}}
     )
+    invalidate_cached_user(transaction["user_id"])
+    logger.info("Verified transaction %s for order ID: %s", transaction["id"], order_id)
+
+@api_router.post("/webhooks/amazon-associates")
+async def amazon_associates_webhook(
+    background: BackgroundTasks,
+    payload: Dict[str, Any] = Body(...)
+):
+    # This is a placeholder for the Amazon Associates webhook
+    # In a real implementation, you would validate the webhook signature
+    # and process the data accordingly
     
-    return {"status": "success", "transaction_id": transaction["id"]}
+    # Extract order details from payload (this would depend on actual Amazon webhook format)
+    # This is just a placeholder
+    order_id = payload.get("amazon_order_id")
+    if not order_id:
+        raise HTTPException(status_code=400, detail="Missing order ID")
+    
+    # Acknowledge right away; the transaction is verified after the response is sent
+    background.add_task(process_amazon_webhook, payload)
+    return Response(content=WEBHOOK_QUEUED_RESPONSE_BODY, media_type="application/json")
 
 # Admin verification endpoint
 @api_router.put("/admin/transactions/{transaction_id}/verify")
@@ -535,11 +707,6 @@ async def admin_verify_transaction(
     # In a real app, we would check if the current user is an admin
     # For this demo, we'll skip that check
     
-    # Find transaction
-    transaction = await db.transactions.find_one({"id": transaction_id})
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
-    
     # Update transaction
     update_data = {
         "status": status,
@@ -548,20 +715,115 @@ async def admin_verify_transaction(
         "verified_at": datetime.utcnow()
     }
     
-    await db.transactions.update_one(
+    transaction = await db.transactions.find_one_and_update(
         {"id": transaction_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
     )
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
     
-    # If verified, update user's cashback balance
-    if status == TransactionStatus.VERIFIED:
+    # If newly verified, update user's cashback balance
+    if status == TransactionStatus.VERIFIED and transaction["status"] != TransactionStatus.VERIFIED:
         await db.users.update_one(
             {"id": transaction["user_id"]},
             {"$inc": {"cashback_balance": transaction["cashback_amount"]}}
         )
+        invalidate_cached_user(transaction["user_id"])
     
     return {"status": "success"}
 
+# Batch gateway: lets clients coalesce several API calls into one round trip
+async def dispatch_subrequest(item: BatchRequestItem, authorization: Optional[str]):
+    path, _, query_string = item.path.partition("?")
+    body = orjson.dumps(item.body) if item.body is not None else b""
+    headers = []
+    if authorization:
+        headers.append((b"authorization", authorization.encode("latin-1")))
+    if body:
+        headers.append((b"content-type", b"application/json"))
+    
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": item.method.upper(),
+        "scheme": "http",
+        "path": unquote(path),
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": headers,
+        "client": None,
+        "server": None,
+    }
+    
+    request_sent = False
+    response_done = asyncio.Event()
+    response_status = 500
+    response_headers = {}
+    chunks = []
+    
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Only reached by handlers listening for a disconnect
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+    
+    async def send(message):
+        nonlocal response_status
+        if message["type"] == "http.response.start":
+            response_status = message["status"]
+            response_headers.update(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_done.set()
+    
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # A streamed response may already have recorded a 200 and part of its
+        # body, so neither can be trusted
+        logger.exception("Batch sub-request failed: %s %s", item.method, item.path)
+        return {"status": 500, "body": None}
+    
+    content = b"".join(chunks)
+    if not content:
+        response_body = None
+    elif response_headers.get(b"content-type", b"").startswith(b"application/json"):
+        try:
+            response_body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            logger.error("Batch sub-request returned invalid JSON: %s %s", item.method, item.path)
+            return {"status": 500, "body": None}
+    else:
+        response_body = content.decode()
+    return {"status": response_status, "body": response_body}
+
+@api_router.post("/batch", response_model=BatchResponse)
+async def batch(batch_request: BatchRequest, request: Request):
+    if len(batch_request.requests) > MAX_BATCH_REQUESTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch may contain at most {MAX_BATCH_REQUESTS} requests"
+        )
+    for item in batch_request.requests:
+        # Check the decoded path, which is what routing matches against
+        path = unquote(item.path.partition("?")[0])
+        if not path.startswith("/api/") or path.startswith("/api/batch"):
+            raise HTTPException(status_code=400, detail=f"Invalid batch path: {item.path}")
+    
+    # Sub-requests run concurrently and share the caller's credentials
+    authorization = request.headers.get("authorization")
+    responses = await asyncio.gather(
+        *[dispatch_subrequest(item, authorization) for item in batch_request.requests]
+    )
+    return {"responses": responses}
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -581,6 +843,44 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def ensure_index(collection, keys, **kwargs):
+    # Existing data can violate a new index (e.g. duplicate emails registered
+    # before the unique index existed); serve without it rather than not at all
+    try:
+        await collection.create_index(keys, **kwargs)
+    except OperationFailure:
+        logger.exception("Failed to create index %s on %s", keys, collection.name)
+
+@app.on_event("startup")
+async def startup_db_client():
+    # Open connections before the first request instead of during it
+    await db.command("ping")
+    
+    # Back every lookup the endpoints make with an index
+    await asyncio.gather(
+        ensure_index(db.users, "email", unique=True),
+        ensure_index(db.users, "id", unique=True),
+        ensure_index(db.products, "id", unique=True),
+        ensure_index(db.products, [("category", 1), ("created_at", -1), ("id", -1)]),
+        ensure_index(db.products, [("created_at", -1), ("id", -1)]),
+        ensure_index(db.transactions, "id", unique=True),
+        ensure_index(db.transactions, [("user_id", 1), ("created_at", -1)]),
+        ensure_index(
+            db.transactions,
+            "amazon_order_id",
+            partialFilterExpression={"amazon_order_id": {"$type": "string"}}
+        ),
+        ensure_index(db.bank_accounts, "user_id"),
+        ensure_index(db.upi_details, "user_id"),
+        ensure_index(db.redemption_requests, [("user_id", 1), ("created_at", -1)]),
+    )
+    
+    # Start the bcrypt workers now so the first logins don't pay for it
+    await asyncio.gather(
+        *[run_in_bcrypt_pool(get_password_hash, "warmup") for _ in range(BCRYPT_POOL_WORKERS)]
+    )
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    await client.close()
+    BCRYPT_POOL.shutdown(wait=False)
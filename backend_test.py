@@ -115,6 +115,43 @@ class CashXAPITester:
             200
         )
 
+    def test_get_products_paging(self):
+        """Test the page size cap and keyset paging of products"""
+        success, _ = self.run_test(
+            "Get Products Over Page Size Cap",
+            "GET",
+            "products?limit=101",
+            422
+        )
+        if not success:
+            return False, {}
+        
+        success, first_page = self.run_test(
+            "Get Products Page 1",
+            "GET",
+            "products?limit=2",
+            200
+        )
+        if not success or len(first_page) < 2:
+            return success, first_page
+        
+        last = first_page[-1]
+        success, second_page = self.run_test(
+            "Get Products Page 2",
+            "GET",
+            f"products?limit=2&after={last['created_at']}_{last['id']}",
+            200
+        )
+        if not success:
+            return success, second_page
+        
+        repeated = {p['id'] for p in first_page} & {p['id'] for p in second_page}
+        if repeated:
+            print(f"❌ Page 2 repeats products from page 1: {repeated}")
+            self.tests_passed -= 1
+            return False, second_page
+        return success, second_page
+
     def test_get_product_by_id(self, product_id):
         """Test getting a product by ID"""
         return self.run_test(
@@ -207,6 +244,48 @@ class CashXAPITester:
             200
         )
 
+    def test_batch(self):
+        """Test coalescing GET and POST calls through the batch endpoint"""
+        data = {
+            "requests": [
+                {"method": "GET", "path": "/api/users/me"},
+                {"method": "GET", "path": "/api/products?limit=2"},
+                {
+                    "method": "POST",
+                    "path": "/api/upi",
+                    "body": {"upi_id": f"test{uuid.uuid4().hex[:8]}@upi", "is_default": False}
+                },
+                {"method": "GET", "path": f"/api/products/{uuid.uuid4()}"}
+            ]
+        }
+        success, response = self.run_test(
+            "Batch Requests",
+            "POST",
+            "batch",
+            200,
+            data=data
+        )
+        if not success:
+            return success, response
+        
+        statuses = [item.get("status") for item in response.get("responses", [])]
+        if statuses != [200, 200, 200, 404]:
+            print(f"❌ Unexpected sub-request statuses: {statuses}")
+            self.tests_passed -= 1
+            return False, response
+        return success, response
+        
+    def test_batch_rejects_nested_batch(self):
+        """Test that the batch endpoint refuses to dispatch to itself"""
+        data = {"requests": [{"method": "POST", "path": "/api/batch", "body": {"requests": []}}]}
+        return self.run_test(
+            "Batch Rejects Nested Batch",
+            "POST",
+            "batch",
+            400,
+            data=data
+        )
+
 def main():
     # Setup
     tester = CashXAPITester()
@@ -247,6 +326,9 @@ def main():
     else:
         print(f"Found {len(products_response)} products")
         
+        # Test paging through products
+        tester.test_get_products_paging()
+        
         # If we have products, test getting a specific product
         if products_response and len(products_response) > 0:
             product_id = products_response[0]['id']
@@ -283,6 +365,10 @@ def main():
             if redemption_success:
                 tester.test_get_redemption_requests()
     
+    # Test batching several calls into one round trip
+    tester.test_batch()
+    tester.test_batch_rejects_nested_batch()
+    
     # Print results
     print(f"\n📊 Tests passed: {tester.tests_passed}/{tester.tests_run}")
     return 0 if tester.tests_passed == tester.tests_run else 1